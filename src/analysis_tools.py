@@ -2,6 +2,9 @@ import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 from action_conversions import index_to_action, action_to_index
+from baseline_policies import set_to_action_format
+from exact_solution import solve_expected_scores
+from move_table import MoveTable, mask_to_board
 import pygame
 
 
@@ -68,104 +71,196 @@ def plot_training(env_wrapped):
     plt.show()
 
 
+def get_ranked_moves(agent, table, exact_points, board, roll):
+    # legal flips for (board, roll) with learned and exact expected points,
+    # ranked by the learned value; flips the agent never tried have no learned value
+    moves = table.moves[board, roll, : table.move_counts[board, roll]]
+    action_values = agent.q_values.get((mask_to_board(table.board_size, board), roll))
+    ranked = [
+        (
+            set(index_to_action(table.board_size, move)).difference(set([0])),
+            None
+            if action_values is None or action_values[move, 1] == 0
+            else action_values[move, 0],
+            exact_points[board ^ move],
+        )
+        for move in moves.tolist()
+    ]
+    return sorted(
+        ranked,
+        key=lambda x: (x[1] if x[1] is not None else -np.inf, x[2]),
+        reverse=True,
+    )
+
+
 def plot_policy(
-    agent, board_size=9, number_of_dice=2, number_of_sides=6, window_width=1024, fps=1
+    agent, board_size=9, number_of_dice=2, number_of_sides=6, window_width=1024
 ):
-    board_state = np.ones(board_size)
+    # left click toggles a tile, number keys set the roll (0 for 10) and the
+    # arrow keys step it; the window only redraws after an event changed something
+    table = MoveTable(board_size, number_of_dice, number_of_sides)
+    exact_points = table.tile_sums[table.full_board] - solve_expected_scores(table)
+    board = table.full_board
+    roll = (number_of_dice * (number_of_sides + 1)) // 2
+    ranked_cache = dict()
+
     window_height = window_width * 3 / 4
     pygame.init()
     pygame.display.init()
     window = pygame.display.set_mode((window_width, window_height))
-    clock = pygame.time.Clock()
-
     canvas = pygame.Surface((window_width, window_height))
-    canvas.fill((0, 100, 0))
     pix_number_size_width = window_width / board_size
     pix_number_size_height = window_height / 3
+    font = pygame.font.Font(pygame.font.get_default_font(), 36)
+    small_font = pygame.font.Font(pygame.font.get_default_font(), 24)
 
+    changed = True
     run = True
     while run:
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:  # and event.button == 1:
-                # update
-                ## if mouse is pressed get position of cursor ##
-                pos = pygame.mouse.get_pos()
-                ## check if cursor is on button ##
-            elif event.type == pygame.QUIT:
-                run = False
-                pygame.display.quit()
-                pygame.quit()
-
-        for i, number in enumerate(board_state):
-            if number != 0:
-                color = (222, 184, 135)
-            else:
-                color = (139, 69, 19)
-
-            pygame.draw.rect(
+        if changed:
+            if (board, roll) not in ranked_cache:
+                ranked_cache[(board, roll)] = get_ranked_moves(
+                    agent, table, exact_points, board, roll
+                )
+            ranked_moves = ranked_cache[(board, roll)]
+            render_board(
+                mask_to_board(board_size, board),
                 canvas,
-                color,
-                pygame.Rect(
-                    (i * pix_number_size_width, 0),
-                    (pix_number_size_width, pix_number_size_height),
-                ),
+                font,
+                window_width,
+                window_height,
             )
-            font = pygame.font.Font(pygame.font.get_default_font(), 36)
-            text = font.render(f"{i+1}", True, (0, 0, 0))
-            text_rect = text.get_rect(
-                center=(
-                    i * pix_number_size_width + pix_number_size_width / 2,
-                    window_height / 4,
-                )
+            text = font.render(f"{roll}", True, (0, 0, 0))
+            canvas.blit(
+                text,
+                dest=text.get_rect(
+                    center=(window_width / 2, pix_number_size_height + 30)
+                ),
             )
-            canvas.blit(text, dest=text_rect)
-
-        for x in range(1, board_size):
-            pygame.draw.line(
+            display_ranked_actions(
+                ranked_moves,
                 canvas,
-                0,
-                (pix_number_size_width * x, 0),
-                (pix_number_size_width * x, pix_number_size_height),
-                width=3,
+                small_font,
+                window_width,
+                window_height,
             )
+            if ranked_moves and ranked_moves[0][1] is not None:
+                render_best_flip(
+                    set_to_action_format(ranked_moves[0][0], board_size),
+                    window_width,
+                    window_height,
+                    table,
+                    canvas,
+                    None,
+                    None,
+                    None,
+                )
+            window.blit(canvas, canvas.get_rect())
+            pygame.display.update()
+            changed = False
 
-        pygame.draw.line(canvas, 0, (0, 0), (0, window_height), width=3)
-        pygame.draw.line(canvas, 0, (0, 0), (window_width, 0), width=3)
-        pygame.draw.line(
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            run = False
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            x, y = event.pos
+            if y < pix_number_size_height:
+                board ^= 1 << min(int(x // pix_number_size_width), board_size - 1)
+                changed = True
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_UP:
+                new_roll = roll + 1
+            elif event.key == pygame.K_DOWN:
+                new_roll = roll - 1
+            elif event.unicode and event.unicode in "0123456789":
+                new_roll = int(event.unicode) or 10
+            else:
+                new_roll = roll
+            new_roll = min(max(new_roll, number_of_dice), table.max_roll)
+            changed = new_roll != roll
+            roll = new_roll
+
+    close(window)
+
+
+def render_board(board_state, canvas, font, window_width, window_height):
+    board_size = len(board_state)
+    canvas.fill((0, 100, 0))
+    pix_number_size_width = window_width / board_size
+    pix_number_size_height = window_height / 3
+
+    for i, number in enumerate(board_state):
+        if number != 0:
+            color = (222, 184, 135)
+        else:
+            color = (139, 69, 19)
+
+        pygame.draw.rect(
             canvas,
-            0,
-            (0, window_height),
-            (window_width, window_height),
-            width=3,
+            color,
+            pygame.Rect(
+                (i * pix_number_size_width, 0),
+                (pix_number_size_width, pix_number_size_height),
+            ),
         )
+        text = font.render(f"{i+1}", True, (0, 0, 0))
+        text_rect = text.get_rect(
+            center=(
+                i * pix_number_size_width + pix_number_size_width / 2,
+                window_height / 4,
+            )
+        )
+        canvas.blit(text, dest=text_rect)
+
+    for x in range(1, board_size):
         pygame.draw.line(
             canvas,
             0,
-            (window_width, 0),
-            (window_width, window_height),
+            (pix_number_size_width * x, 0),
+            (pix_number_size_width * x, pix_number_size_height),
             width=3,
         )
 
-        window.blit(canvas, canvas.get_rect())
-        pygame.event.pump()
-        pygame.display.update()
-
+    pygame.draw.line(canvas, 0, (0, 0), (0, window_height), width=3)
+    pygame.draw.line(canvas, 0, (0, 0), (window_width, 0), width=3)
+    pygame.draw.line(
+        canvas,
+        0,
+        (0, window_height),
+        (window_width, window_height),
+        width=3,
+    )
+    pygame.draw.line(
+        canvas,
+        0,
+        (window_width, 0),
+        (window_width, window_height),
+        width=3,
+    )
 
-def display_ranked_actions(agent, obs, canvas, window_width, window_height, window):
-    font = pygame.font.Font(pygame.font.get_default_font(), 36)
-    text = font.render(f"{get_ranked_actions(agent, obs)}", True, (0, 0, 0))
 
-    text_rect = text.get_rect(
-        center=(
-            window_width / 2,
-            window_height / 2,
-        )
-    )
-    canvas.blit(text, dest=text_rect)
+def display_ranked_actions(ranked_moves, canvas, font, window_width, window_height):
+    line_height = font.get_linesize()
+    top = window_height / 3 + 60
+    lines = ["flip", "learned", "exact"]
+    if not ranked_moves:
+        lines = ["no possible flip", "", ""]
 
-    window.blit(canvas, canvas.get_rect())
-    pygame.event.pump()
-    pygame.display.update()
+    rows = [lines] + [
+        [
+            f"{sorted(tiles)}",
+            "-" if learned is None else f"{learned:.2f}",
+            f"{exact:.2f}",
+        ]
+        for tiles, learned, exact in ranked_moves
+    ]
+    for row_number, row in enumerate(rows):
+        y = top + row_number * line_height
+        if y + line_height > window_height:
+            break
+        for column, value in enumerate(row):
+            text = font.render(value, True, (0, 0, 0))
+            canvas.blit(text, dest=(window_width * (0.1 + 0.3 * column), y))
 
 
 def render_best_flip(
@@ -216,10 +311,12 @@ def render_best_flip(
                     width=8,
                 )
 
-    window.blit(canvas, canvas.get_rect())
-    pygame.event.pump()
-    pygame.display.update()
-    clock.tick(fps)
+    if window is not None:
+        window.blit(canvas, canvas.get_rect())
+        pygame.event.pump()
+        pygame.display.update()
+    if clock is not None:
+        clock.tick(fps)
 
 
 def close(window):
@@ -1,4 +1,5 @@
 import numpy as np
+from functools import lru_cache
 from typing import List, Set, Dict, AnyStr
 
 
@@ -49,3 +50,69 @@ def choose_from_lexographical_ordering(obs, largest_first, index):
 
 def set_to_action_format(to_flip, board_size):
     return [i if i in to_flip else 0 for i in range(1, board_size + 1)]
+
+
+# batched baselines take arrays of board masks and dice sums, look up the legal
+# flips in a shared MoveTable and return arrays of action indices, 0 if stuck
+
+
+def choose_random_batch(table, boards, rolls, rng):
+    counts = table.move_counts[boards, rolls]
+    picks = (rng.random(len(boards)) * np.maximum(counts, 1)).astype(np.int64)
+    return np.where(counts > 0, table.moves[boards, rolls, picks], 0)
+
+
+@lru_cache
+def _lexographical_ranks(board_size, largest_first):
+    # rank of every action index under the same string key as
+    # choose_from_lexographical_ordering, so "10" sorts before "2"
+    keys = [
+        ",".join(
+            map(
+                str,
+                sorted(
+                    [i for i in range(1, board_size + 1) if (index >> (i - 1)) & 1],
+                    reverse=largest_first,
+                ),
+            )
+        )
+        for index in range(2**board_size)
+    ]
+    order = sorted(range(2**board_size), key=lambda i: keys[i], reverse=largest_first)
+    ranks = np.empty(2**board_size, dtype=np.int64)
+    ranks[order] = np.arange(2**board_size)
+    return ranks
+
+
+def _choose_lowest_key(keys, moves, valid):
+    best = np.take_along_axis(
+        moves, np.where(valid, keys, np.inf).argmin(axis=1)[:, None], axis=1
+    )[:, 0]
+    return np.where(valid.any(axis=1), best, 0)
+
+
+def choose_from_lexographical_ordering_batch(
+    table, boards, rolls, rng, largest_first, index=0
+):
+    ranks = _lexographical_ranks(table.board_size, largest_first)
+    moves, valid = table.legal_moves(boards, rolls)
+    if index == 0:
+        return _choose_lowest_key(ranks[moves], moves, valid)
+    order = np.argsort(np.where(valid, ranks[moves], len(ranks)), axis=1)
+    picks = np.minimum(index, np.maximum(valid.sum(axis=1) - 1, 0))
+    picks = np.take_along_axis(order, picks[:, None], axis=1)
+    chosen = np.take_along_axis(moves, picks, axis=1)[:, 0]
+    return np.where(valid.any(axis=1), chosen, 0)
+
+
+def choose_fewest_tiles_batch(table, boards, rolls, rng):
+    # ties between flips with the same number of tiles are broken at random
+    moves, valid = table.legal_moves(boards, rolls)
+    keys = table.tile_counts[moves] + rng.random(moves.shape)
+    return _choose_lowest_key(keys, moves, valid)
+
+
+def choose_most_tiles_batch(table, boards, rolls, rng):
+    moves, valid = table.legal_moves(boards, rolls)
+    keys = -table.tile_counts[moves] + rng.random(moves.shape)
+    return _choose_lowest_key(keys, moves, valid)
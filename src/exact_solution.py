@@ -1,6 +1,18 @@
+import json
+import os
+import sys
+import time
+import warnings
+import numpy as np
 from typing import List
 from itertools import combinations
 from tqdm import tqdm
+from move_table import MoveTable, roll_probabilities
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 expected_return = {}
@@ -42,10 +54,293 @@ def calc_expected_return(board_state: List[int]):
     return sum([prob_two_dices[i] * returns[i] for i in range(11)])
 
 
-for r in tqdm(range(1, 10)):
-    for combination in combinations(range(1, 10), r):
-        c = calc_expected_return(list(combination))
-        expected_return[str(list(combination))] = c
+def _best_over_moves(table: MoveTable, layer, roll, values, minimize=True):
+    moves, valid = table.legal_moves(layer, roll)
+    next_values = values[layer[:, None] ^ moves]
+    fill = np.inf if minimize else -np.inf
+    if next_values.ndim == 3:
+        valid = valid[..., None]
+    next_values = np.where(valid, next_values, fill)
+    best = next_values.min(axis=1) if minimize else next_values.max(axis=1)
+    return best, table.move_counts[layer, roll] > 0
+
+
+def solve_expected_scores(table: MoveTable):
+    # minimal expected sum of the tiles left open, for every board mask
+    scores = table.tile_sums.astype(np.float64)
+    for layer in table.layers()[1:]:
+        expected = np.zeros(len(layer))
+        for roll, probability in enumerate(table.roll_probabilities):
+            if probability == 0:
+                continue
+            best, can_move = _best_over_moves(table, layer, roll, scores)
+            expected += probability * np.where(can_move, best, table.tile_sums[layer])
+        scores[layer] = expected
+    return scores
+
+
+def solve_win_probabilities(table: MoveTable, tie_weight: float = 0.0):
+    # win_probabilities[mask, target] is the best expected win share against
+    # target, finishing below it counts 1 and finishing equal counts tie_weight,
+    # targets run from 0 to the sum of the full board plus one
+    targets = np.arange(table.tile_sums[table.full_board] + 2)
+    stuck = (table.tile_sums[:, None] < targets[None, :]) + tie_weight * (
+        table.tile_sums[:, None] == targets[None, :]
+    )
+    win_probabilities = stuck.copy()
+    for layer in table.layers()[1:]:
+        probability_sum = np.zeros((len(layer), len(targets)))
+        for roll, probability in enumerate(table.roll_probabilities):
+            if probability == 0:
+                continue
+            best, can_move = _best_over_moves(
+                table, layer, roll, win_probabilities, minimize=False
+            )
+            probability_sum += probability * np.where(
+                can_move[:, None], best, stuck[layer]
+            )
+        win_probabilities[layer] = probability_sum
+    return win_probabilities
+
+
+def _binomials(board_size: int):
+    binomials = np.zeros((board_size + 1, board_size + 2), dtype=np.int64)
+    binomials[:, 0] = 1
+    for n in range(1, board_size + 1):
+        binomials[n, 1:] = binomials[n - 1, 1:] + binomials[n - 1, :-1]
+    return binomials
+
+
+def _layer_ranks(masks, binomials, board_size: int):
+    # position of every mask within its popcount layer, masks with the same
+    # number of open tiles are ranked in ascending order
+    ranks = np.zeros(len(masks), dtype=np.int64)
+    count = np.zeros(len(masks), dtype=np.int64)
+    for position in range(board_size):
+        bit = (masks >> position) & 1
+        count += bit
+        ranks += bit * binomials[position, count]
+    return ranks
+
+
+def _layer_masks(ranks, open_tiles: int, binomials):
+    masks = np.zeros(len(ranks), dtype=np.int64)
+    ranks = ranks.copy()
+    for i in range(open_tiles, 0, -1):
+        positions = np.searchsorted(binomials[:, i], ranks, side="right") - 1
+        masks |= np.int64(1) << positions
+        ranks -= binomials[positions, i]
+    return masks
+
+
+def _flips_per_roll(board_size: int, max_roll: int):
+    # action indices of every set of tiles summing up to each roll
+    flips = [[] for _ in range(max_roll + 1)]
+    for r in range(1, board_size + 1):
+        for combination in combinations(range(1, min(board_size, max_roll) + 1), r):
+            if sum(combination) <= max_roll:
+                flips[sum(combination)].append(
+                    sum(1 << (i - 1) for i in combination)
+                )
+    return [np.array(f, dtype=np.int64) for f in flips]
+
+
+def _layer_path(directory: str, open_tiles: int):
+    return os.path.join(directory, f"layer_{open_tiles}.npy")
+
+
+def solve_out_of_core(
+    directory: str,
+    board_size: int = 16,
+    number_of_dice: int = 2,
+    number_of_sides: int = 6,
+    memory_limit: int = 2**30,
+):
+    # minimal expected sum of the tiles left open, solved one popcount layer at
+    # a time; finished layers are stored as float32 .npy files in directory and
+    # are skipped when the solver is restarted after an interruption;
+    # memory_limit bounds the layer and working arrays, a few MB of interpreter
+    # overhead come on top, and a warning is raised if the peak rss grows more;
+    # per-layer peak rss is only measured on Linux, elsewhere it is None
+    os.makedirs(directory, exist_ok=True)
+    settings = {
+        "board_size": board_size,
+        "number_of_dice": number_of_dice,
+        "number_of_sides": number_of_sides,
+    }
+    settings_path = os.path.join(directory, "settings.json")
+    if os.path.exists(settings_path):
+        with open(settings_path) as f:
+            if json.load(f) != settings:
+                raise ValueError(f"{directory} holds a solution for other settings")
+    else:
+        with open(settings_path, "w") as f:
+            json.dump(settings, f)
+
+    probabilities = roll_probabilities(number_of_dice, number_of_sides)
+    flips = _flips_per_roll(board_size, len(probabilities) - 1)
+    flip_sizes = sorted(set(flip.bit_count() for f in flips for flip in f.tolist()))
+    binomials = _binomials(board_size)
+
+    layers = dict()
+    statistics = []
+    solver_start_rss = _current_rss_mb()
+    start_process_peak_rss = _process_peak_rss_mb()
+    for open_tiles in range(board_size + 1):
+        path = _layer_path(directory, open_tiles)
+        needed = [open_tiles - n for n in flip_sizes if open_tiles - n >= 0]
+        layers = {k: v for k, v in layers.items() if k in needed}
+        if os.path.exists(path):
+            layers[open_tiles] = None
+            continue
+
+        for k in needed:
+            if layers.get(k) is None:
+                layers[k] = np.load(_layer_path(directory, k))
+        layer_size = int(binomials[board_size, open_tiles])
+        # the written pages of the current layer stay resident until it is closed
+        budget = (
+            memory_limit
+            - sum(layer.nbytes for layer in layers.values())
+            - 4 * layer_size
+        )
+        # at most about 24 int64 or float64 working arrays per board state
+        chunk_size = budget // 192
+        if chunk_size <= 0:
+            raise MemoryError(
+                f"layers {needed} and {open_tiles} alone exceed the memory limit "
+                f"of {memory_limit}"
+            )
+
+        start = time.perf_counter()
+        start_rss = _current_rss_mb()
+        layer_peak_measured = _reset_peak_rss()
+        partial_path = path[: -len(".npy")] + ".partial.npy"
+        scores = np.lib.format.open_memmap(
+            partial_path, mode="w+", dtype=np.float32, shape=(layer_size,)
+        )
+        for first in range(0, layer_size, chunk_size):
+            ranks = np.arange(first, min(first + chunk_size, layer_size))
+            masks = _layer_masks(ranks, open_tiles, binomials)
+            tile_sums = np.zeros(len(masks), dtype=np.int64)
+            for position in range(board_size):
+                tile_sums += ((masks >> position) & 1) * (position + 1)
+            expected = np.zeros(len(masks))
+            for roll, probability in enumerate(probabilities):
+                if probability == 0:
+                    continue
+                best = np.full(len(masks), np.inf)
+                for flip in flips[roll]:
+                    legal = (flip & ~masks) == 0
+                    if not legal.any():
+                        continue
+                    next_masks = masks[legal] ^ flip
+                    next_layer = layers[open_tiles - int(flip).bit_count()]
+                    best[legal] = np.minimum(
+                        best[legal],
+                        next_layer[_layer_ranks(next_masks, binomials, board_size)],
+                    )
+                expected += probability * np.where(np.isinf(best), tile_sums, best)
+            scores[ranks] = expected
+        scores.flush()
+        del scores
+        os.replace(partial_path, path)
+        layers[open_tiles] = None
+
+        duration = time.perf_counter() - start
+        layer_peak_rss = _layer_peak_rss_mb() if layer_peak_measured else None
+        statistics.append(
+            {
+                "open_tiles": open_tiles,
+                "states": layer_size,
+                "seconds": duration,
+                "states_per_second": layer_size / max(duration, 1e-9),
+                "start_rss_mb": start_rss,
+                "end_rss_mb": _current_rss_mb(),
+                "peak_rss_mb": layer_peak_rss,
+                "process_peak_rss_mb": _process_peak_rss_mb(),
+            }
+        )
+        print(
+            f"layer {open_tiles}: {layer_size} states in {duration:.2f}s "
+            f"({statistics[-1]['states_per_second']:.0f}/s), "
+            f"rss {_format_mb(start_rss)} -> {_format_mb(_current_rss_mb())} MB, "
+            f"layer peak {_format_mb(layer_peak_rss)} MB"
+        )
+
+        if layer_peak_rss is not None and solver_start_rss is not None:
+            peak_growth = layer_peak_rss - solver_start_rss
+        elif start_process_peak_rss is not None:
+            peak_growth = _process_peak_rss_mb() - start_process_peak_rss
+        else:
+            peak_growth = None
+        if peak_growth is not None and peak_growth * 2**20 > memory_limit:
+            warnings.warn(
+                f"peak rss grew by {peak_growth:.0f} MB during layer {open_tiles}, "
+                f"above the memory limit of {memory_limit / 2**20:.0f} MB"
+            )
+    return statistics
+
+
+def _current_rss_mb():
+    # resident set size right now, only available where /proc exists (Linux)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+def _reset_peak_rss():
+    # resets the VmHWM high-water mark, only possible on Linux
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _layer_peak_rss_mb():
+    # peak resident set size since the last _reset_peak_rss
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+def _process_peak_rss_mb():
+    # high-water mark of the whole process, ru_maxrss is in bytes on macOS and
+    # in kilobytes on Linux, the resource module does not exist on Windows
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _format_mb(value):
+    return "?" if value is None else f"{value:.0f}"
+
+
+def load_expected_score(directory: str, board_state: List[int]):
+    with open(os.path.join(directory, "settings.json")) as f:
+        board_size = json.load(f)["board_size"]
+    mask = np.array([sum(1 << (i - 1) for i in board_state if i != 0)])
+    layer = np.load(
+        _layer_path(directory, len([i for i in board_state if i != 0])), mmap_mode="r"
+    )
+    return float(layer[_layer_ranks(mask, _binomials(board_size), board_size)[0]])
+
+
+if __name__ == "__main__":
+    for r in tqdm(range(1, 10)):
+        for combination in combinations(range(1, 10), r):
+            c = calc_expected_return(list(combination))
+            expected_return[str(list(combination))] = c
 
-print(expected_return[str(list(range(1, 10)))])
-print(len(expected_return))
+    print(expected_return[str(list(range(1, 10)))])
+    print(len(expected_return))
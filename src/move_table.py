@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def roll_probabilities(number_of_dice: int = 2, number_of_sides: int = 6):
+    # probability of every dice sum, indexed by the sum itself
+    probabilities = np.ones(1)
+    for _ in range(number_of_dice):
+        probabilities = np.convolve(
+            probabilities, np.ones(number_of_sides) / number_of_sides
+        )
+    return np.concatenate([np.zeros(number_of_dice), probabilities])
+
+
+def board_to_mask(board_state):
+    # bit i is set while tile i + 1 is still open, same layout as action indices
+    return sum(1 << (i - 1) for i in board_state if i != 0)
+
+
+def mask_to_board(board_size: int, mask: int):
+    return tuple(i if (mask >> (i - 1)) & 1 else 0 for i in range(1, board_size + 1))
+
+
+class MoveTable:
+    def __init__(
+        self, board_size: int = 9, number_of_dice: int = 2, number_of_sides: int = 6
+    ):
+        self.board_size = board_size
+        self.number_of_dice = number_of_dice
+        self.number_of_sides = number_of_sides
+        self.roll_probabilities = roll_probabilities(number_of_dice, number_of_sides)
+        self.max_roll = len(self.roll_probabilities) - 1
+        self.full_board = 2**board_size - 1
+
+        masks = np.arange(2**board_size, dtype=np.int64)
+        bits = (masks[:, None] >> np.arange(board_size)) & 1
+        self.tile_sums = bits @ np.arange(1, board_size + 1)
+        self.tile_counts = bits.sum(axis=1)
+
+        # moves[mask, roll, :move_counts[mask, roll]] are the legal action indices
+        candidates = [masks[self.tile_sums == roll] for roll in range(self.max_roll + 1)]
+        max_moves = max(1, max(len(c) for c in candidates))
+        self.moves = np.zeros((len(masks), self.max_roll + 1, max_moves), dtype=np.int64)
+        self.move_counts = np.zeros((len(masks), self.max_roll + 1), dtype=np.int64)
+        for roll in range(1, self.max_roll + 1):
+            if len(candidates[roll]) == 0:
+                continue
+            legal = (candidates[roll][None, :] & ~masks[:, None]) == 0
+            order = np.argsort(~legal, axis=1, kind="stable")
+            self.moves[:, roll, : len(candidates[roll])] = np.where(
+                np.take_along_axis(legal, order, axis=1), candidates[roll][order], 0
+            )
+            self.move_counts[:, roll] = legal.sum(axis=1)
+
+    def layers(self):
+        # board masks grouped by number of open tiles, smallest boards first
+        return [
+            np.flatnonzero(self.tile_counts == n) for n in range(self.board_size + 1)
+        ]
+
+    def legal_moves(self, boards, rolls):
+        moves = self.moves[boards, rolls]
+        valid = np.arange(moves.shape[-1]) < self.move_counts[boards, rolls][..., None]
+        return moves, valid
+
+    def roll_dice(self, rng, size):
+        return rng.integers(
+            1, self.number_of_sides + 1, size=(size, self.number_of_dice)
+        ).sum(axis=1)
+
+    def is_legal(self, boards, rolls, actions):
+        return (
+            (actions != 0)
+            & ((actions & ~boards) == 0)
+            & (self.tile_sums[actions] == rolls)
+        )
@@ -0,0 +1,213 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import permutations
+from action_conversions import action_to_index
+from baseline_policies import (
+    choose_random_batch,
+    choose_from_lexographical_ordering_batch,
+    choose_fewest_tiles_batch,
+    choose_most_tiles_batch,
+)
+from exact_solution import solve_expected_scores, solve_win_probabilities
+from move_table import MoveTable, board_to_mask, mask_to_board
+
+# every tournament policy is called as policy(table, boards, rolls, targets, rng)
+# with arrays of board masks, dice sums and the score to beat (np.inf for the
+# first seat) and returns an array of action indices, 0 meaning no flip
+
+
+def _score_blind(policy, table, boards, rolls, targets, rng):
+    return policy(table, boards, rolls, rng)
+
+
+def _choose_best_value(values, table, boards, rolls, targets, rng):
+    moves, valid = table.legal_moves(boards, rolls)
+    next_values = np.where(valid, values[boards[:, None] ^ moves], -np.inf)
+    best = np.take_along_axis(
+        moves, next_values.argmax(axis=1)[:, None], axis=1
+    )[:, 0]
+    return np.where(valid.any(axis=1), best, 0)
+
+
+def _choose_score_aware(
+    expected_scores, win_probabilities, table, boards, rolls, targets, rng
+):
+    # without a score to beat play for the lowest expected score, otherwise
+    # maximise the expected win share against the target
+    moves, valid = table.legal_moves(boards, rolls)
+    chasing = np.isfinite(targets)
+    columns = np.clip(
+        np.where(chasing, targets, 0), 0, win_probabilities.shape[1] - 1
+    ).astype(np.int64)
+    next_boards = boards[:, None] ^ moves
+    next_values = np.where(
+        chasing[:, None],
+        win_probabilities[next_boards, columns[:, None]],
+        -expected_scores[next_boards],
+    )
+    next_values = np.where(valid, next_values, -np.inf)
+    best = np.take_along_axis(
+        moves, next_values.argmax(axis=1)[:, None], axis=1
+    )[:, 0]
+    return np.where(valid.any(axis=1), best, 0)
+
+
+def _choose_from_q_table(q_table, table, boards, rolls, targets, rng):
+    q_values = np.where(
+        table.legal_moves(boards, rolls)[1], q_table[boards, rolls], -np.inf
+    )
+    best = np.take_along_axis(
+        table.moves[boards, rolls], q_values.argmax(axis=1)[:, None], axis=1
+    )[:, 0]
+    return np.where(table.move_counts[boards, rolls] > 0, best, 0)
+
+
+def _choose_per_observation(policy, table, boards, rolls, targets, rng):
+    return np.array(
+        [
+            action_to_index(policy((mask_to_board(table.board_size, board), roll)))
+            for board, roll in zip(boards.tolist(), rolls.tolist())
+        ],
+        dtype=np.int64,
+    )
+
+
+def random_policy():
+    return partial(_score_blind, choose_random_batch)
+
+
+def lexographical_policy(largest_first, index=0):
+    return partial(
+        _score_blind,
+        partial(
+            choose_from_lexographical_ordering_batch,
+            largest_first=largest_first,
+            index=index,
+        ),
+    )
+
+
+def fewest_tiles_policy():
+    return partial(_score_blind, choose_fewest_tiles_batch)
+
+
+def most_tiles_policy():
+    return partial(_score_blind, choose_most_tiles_batch)
+
+
+def optimal_policy(table: MoveTable):
+    return partial(_choose_best_value, -solve_expected_scores(table))
+
+
+def score_aware_policy(table: MoveTable, tie_weight=0.5):
+    # a tie is worth tie_weight of a win, play_match splits ties between the
+    # tied seats, so 0.5 matches the two-seat games of round_robin
+    return partial(
+        _choose_score_aware,
+        solve_expected_scores(table),
+        solve_win_probabilities(table, tie_weight),
+    )
+
+
+def agent_policy(agent, table: MoveTable):
+    # copy the learned q-values of a KlappbrettAgent into an array aligned with
+    # the move table, so the policy can be pickled and evaluated in batches
+    q_table = np.zeros(table.moves.shape)
+    for (board_state, roll), action_values in agent.q_values.items():
+        mask = board_to_mask(board_state)
+        q_table[mask, roll] = action_values[table.moves[mask, roll], 0]
+    return partial(_choose_from_q_table, q_table)
+
+
+def observation_policy(policy):
+    # wraps single-observation policies like choose_random, slow but general
+    return partial(_choose_per_observation, policy)
+
+
+def play_games(table: MoveTable, policy, targets, rng):
+    boards = np.full(len(targets), table.full_board, dtype=np.int64)
+    playing = np.arange(len(targets))
+    while len(playing) > 0:
+        rolls = table.roll_dice(rng, len(playing))
+        actions = policy(table, boards[playing], rolls, targets[playing], rng)
+        legal = table.is_legal(boards[playing], rolls, actions)
+        boards[playing[legal]] ^= actions[legal]
+        playing = playing[legal]
+    return table.tile_sums[boards]
+
+
+def play_match(table: MoveTable, policies, number_of_games, rng):
+    # seats play in order and later seats know the lowest score so far,
+    # the lowest score wins and ties split the win
+    best_scores = np.full(number_of_games, np.inf)
+    scores = np.empty((len(policies), number_of_games))
+    for seat, policy in enumerate(policies):
+        scores[seat] = play_games(table, policy, best_scores, rng)
+        best_scores = np.minimum(best_scores, scores[seat])
+    winners = scores == best_scores[None, :]
+    return winners / winners.sum(axis=0, keepdims=True)
+
+
+def _play_batch(table, policies, number_of_games, seed):
+    rng = np.random.default_rng(seed)
+    # wrapped observation policies and agents draw from the global np.random,
+    # which forked workers would otherwise all inherit in the same state
+    np.random.seed(rng.integers(2**32))
+    return play_match(table, policies, number_of_games, rng)
+
+
+def _confidence_interval(shares, z):
+    mean = shares.mean()
+    half_width = z * shares.std(ddof=1) / np.sqrt(len(shares))
+    return mean, mean - half_width, mean + half_width
+
+
+def round_robin(
+    table: MoveTable,
+    policies,
+    number_of_games=100_000,
+    batch_size=50_000,
+    processes=None,
+    seed=None,
+    z=1.96,
+):
+    # every ordered pair plays number_of_games in both seat orders,
+    # win_rates[i, j] is the share of games policy i won against policy j
+    names = list(policies.keys())
+    pairings = list(permutations(range(len(names)), 2))
+    batches = [
+        min(batch_size, number_of_games - start)
+        for start in range(0, number_of_games, batch_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(pairings) * len(batches))
+
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(
+                _play_batch,
+                table,
+                [policies[names[first]], policies[names[second]]],
+                size,
+                seeds[p * len(batches) + b],
+            )
+            for p, (first, second) in enumerate(pairings)
+            for b, size in enumerate(batches)
+        ]
+        results = [future.result() for future in futures]
+
+    shares = {pairing: [] for pairing in pairings}
+    for p, (first, second) in enumerate(pairings):
+        for b in range(len(batches)):
+            result = results[p * len(batches) + b]
+            shares[(first, second)].append(result[0])
+            shares[(second, first)].append(result[1])
+
+    win_rates = np.full((len(names), len(names)), np.nan)
+    lower = np.full((len(names), len(names)), np.nan)
+    upper = np.full((len(names), len(names)), np.nan)
+    for (i, j), share in shares.items():
+        win_rates[i, j], lower[i, j], upper[i, j] = _confidence_interval(
+            np.concatenate(share), z
+        )
+    return names, win_rates, lower, upper